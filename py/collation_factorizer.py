@@ -1,17 +1,166 @@
 #!/usr/bin/env python3
 
 import time # to time calculations for users
+import os # for determining the number of available CPUs
+from concurrent.futures import ProcessPoolExecutor # for solving independent optimization problems and running independent NMF trials in parallel
 import numpy as np # matrix support
-import nimfa as nf # for performing non-negative matrix factorization (NMF)
-import scipy as sp # for solving optimization problems behind classifying lacunose witnesses
-import pandas as pd # for writing output to Excel
-import json # for writing output to Excel
+try:
+    import numba as nb # optional, for compiling the NNLS solvers for fragmentary witnesses to native code
+except ImportError:
+    nb = None
 from collation_parser import *
 
+"""
+Machine constants and loop constructs used by the NNLS solvers (defined at module level so that Numba can treat them as compile-time constants).
+"""
+float64_eps = np.finfo(np.float64).eps
+float64_tiny = np.finfo(np.float64).tiny
+prange = range if nb is None else nb.prange
+
+"""
+Solves the non-negative least squares problem min ||Ax - b||^2 over all x >= 0 using the fast NNLS algorithm of Bro and de Jong.
+Rather than A and b, the solver takes the precomputed products AtA = A.T @ A and Atb = A.T @ b,
+so that the Gram matrix can be computed once and reused for every right-hand side.
+The solution is returned along with a flag indicating whether the solver converged within the maximum number of iterations.
+"""
+def fnnls(AtA, Atb, tol=None, max_iter=None):
+    n = Atb.shape[0]
+    if tol is None:
+        tol = 10 * float64_eps * np.linalg.norm(AtA, 1) * n
+    if max_iter is None:
+        max_iter = 3 * n
+    passive = np.zeros(n, dtype=np.bool_) # the passive set of variables that are allowed to be positive
+    x = np.zeros(n)
+    w = Atb - AtA @ x # the negative gradient of the objective
+    n_iter = 0
+    while not passive.all() and np.max(w[~passive]) > tol and n_iter < max_iter:
+        # Move the active variable with the largest gradient into the passive set:
+        active_w = w.copy()
+        active_w[passive] = -np.inf
+        passive[np.argmax(active_w)] = True
+        # Solve the unconstrained least squares problem restricted to the passive set:
+        inds = np.flatnonzero(passive)
+        s = np.zeros(n)
+        s[inds] = np.linalg.lstsq(AtA[inds][:, inds], Atb[inds], rcond=-1.0)[0]
+        # If this solution is infeasible, then step back toward the current solution until it is not:
+        while passive.any() and np.min(s[passive]) <= 0 and n_iter < max_iter:
+            n_iter += 1
+            infeasible = passive & (s <= 0)
+            alpha = np.min(x[infeasible] / np.maximum(x[infeasible] - s[infeasible], float64_tiny))
+            x += alpha * (s - x)
+            passive = passive & (x > tol)
+            x[~passive] = 0
+            inds = np.flatnonzero(passive)
+            s = np.zeros(n)
+            s[inds] = np.linalg.lstsq(AtA[inds][:, inds], Atb[inds], rcond=-1.0)[0]
+        x = s
+        w = Atb - AtA @ x
+        n_iter += 1
+    return x, n_iter < max_iter
+
+"""
+Solves the non-negative least squares problem min ||Ax - b||^2 over all x >= 0 for every column b of B using fnnls,
+given the precomputed products AtA = A.T @ A and AtB = A.T @ B.
+The solutions are returned as the columns of a matrix, along with a boolean array indicating which columns' solutions converged.
+If Numba is available, the columns are solved in parallel.
+"""
+def fnnls_block(AtA, AtB):
+    # Work with the transposes of AtB and the solution matrix, so that each right-hand side is read from and each solution is written to contiguous memory:
+    AtBt = np.ascontiguousarray(AtB.T)
+    Xt = np.zeros(AtBt.shape)
+    converged = np.zeros(AtBt.shape[0], dtype=np.bool_)
+    tol = 10 * float64_eps * np.linalg.norm(AtA, 1) * AtA.shape[0]
+    max_iter = 3 * AtA.shape[0] # the active set rarely needs more than a few passes over the rank-many variables
+    for j in prange(AtBt.shape[0]):
+        x, x_converged = fnnls(AtA, AtBt[j], tol, max_iter)
+        Xt[j] = x
+        converged[j] = x_converged
+    return Xt.T, converged
+
+# If Numba is installed, then compile the NNLS solvers to native code:
+if nb is not None:
+    fnnls = nb.njit(cache=True)(fnnls)
+    fnnls_block = nb.njit(parallel=True, cache=True)(fnnls_block)
+
+"""
+Returns the residual sum of squares and the proportion of explained variance of the product of the given basis and mixture factors
+as an approximation of the given collation matrix, along with the sparseness (Hoyer 2004) of each factor, averaged over its columns.
+"""
+def get_fit_metrics(collation_matrix, W, H):
+    import scipy as sp # for sparse matrix support; imported here, as it is slow to load
+    # Expand ||V - WH||^2 as ||V||^2 - 2<V, WH> + ||WH||^2, so that the product WH never has to be formed:
+    if sp.sparse.issparse(collation_matrix):
+        V_sq_norm = float(collation_matrix.multiply(collation_matrix).sum(dtype=np.float64))
+    else:
+        V_sq_norm = float(np.square(collation_matrix, dtype=np.float64).sum())
+    cross_term = float(np.multiply(np.asarray(collation_matrix @ H.T, dtype=np.float64), W).sum())
+    WH_sq_norm = float(np.multiply(W.T @ W, H @ H.T).sum())
+    rss = max(V_sq_norm - 2 * cross_term + WH_sq_norm, 0.0)
+    evar = 1 - rss / V_sq_norm
+    sparseness = []
+    for X in (W, H):
+        # The sparseness of a column is measured by where its L1-to-L2 norm ratio falls between that of a single nonzero entry and that of a constant vector:
+        eps = np.finfo(X.dtype).eps
+        n = X.shape[0]
+        l1_l2_ratios = (np.abs(X).sum(axis=0) + eps) / (np.sqrt(np.square(X).sum(axis=0)) + eps)
+        sparseness.append(float(np.mean((np.sqrt(n) - l1_l2_ratios) / (np.sqrt(n) - 1))))
+    return rss, evar, sparseness[0], sparseness[1]
+
+"""
+Returns a random initialization of the given rank for the given collation matrix using the random_vcol rule:
+each column of the basis factor is the average of a random fifth of the columns of the collation matrix,
+and each row of the mixture factor is the average of a random fifth of its rows.
+Random numbers are drawn from the given generator.
+"""
+def get_random_vcol_seed(collation_matrix, rank, rng):
+    import scipy as sp # for sparse matrix support; imported here, as it is slow to load
+    n_rows, n_cols = collation_matrix.shape
+    n_sampled_rows, n_sampled_cols = int(np.ceil(n_rows / 5)), int(np.ceil(n_cols / 5))
+    collation_matrix_by_row = sp.sparse.csr_matrix(collation_matrix) # row slicing is efficient in CSR format
+    collation_matrix_by_col = sp.sparse.csc_matrix(collation_matrix) # column slicing is efficient in CSC format
+    W = np.zeros((n_rows, rank))
+    H = np.zeros((rank, n_cols))
+    for i in range(rank):
+        W[:, i] = np.asarray(collation_matrix_by_col[:, rng.choice(n_cols, n_sampled_cols, replace=False)].mean(axis=1)).ravel()
+        H[i, :] = np.asarray(collation_matrix_by_row[rng.choice(n_rows, n_sampled_rows, replace=False), :].mean(axis=0)).ravel()
+    return W, H
+
+"""
+Runs one rank estimation trial on the given collation matrix, sweeping through the given ranks in order
+and warm-starting the factorization for each rank from the solution for the previous rank.
+The factorization for the smallest rank starts from a random_vcol initialization, so that different trials start from genuinely different guesses.
+Random numbers are drawn from a generator seeded with the given seed (an integer or a NumPy SeedSequence).
+For each rank, the dominant group of each witness is returned along with the fit metrics of the factorization.
+"""
+def run_rank_estimation_trial(collation_matrix, ranks, seed):
+    from sklearn.decomposition import NMF # for performing non-negative matrix factorization (NMF); imported here, as it is slow to load
+    rng = np.random.default_rng(seed)
+    # Values on the scale of the collation matrix entries, for the new components of warm starts:
+    avg = float(collation_matrix.mean())
+    trial_results = []
+    W, H = None, None
+    for r in ranks:
+        if W is None:
+            W, H = get_random_vcol_seed(collation_matrix, r, rng)
+        else:
+            # Warm-start from the solution for the previous rank, appending a new random component:
+            scale = np.sqrt(avg / r)
+            W = np.hstack([W, scale * rng.random((W.shape[0], 1))])
+            H = np.vstack([H, scale * rng.random((1, H.shape[1]))])
+        nmf = NMF(n_components=r, init="custom", solver="cd", max_iter=200, tol=1e-4)
+        W = nmf.fit_transform(collation_matrix, W=W.astype(collation_matrix.dtype), H=H.astype(collation_matrix.dtype))
+        H = nmf.components_
+        # Assign each witness to its dominant group:
+        witness_groups = np.argmax(H, axis=0)
+        trial_results.append((witness_groups, get_fit_metrics(collation_matrix, W.astype(np.float64), H.astype(np.float64))))
+    return trial_results
+
 """
 Base class for applying non-negative matrix factorization (NMF) to a collation matrix.
 """
 class collation_factorizer():
+    min_parallel_nnls_witnesses = 1000 # minimum number of fragmentary witnesses for which it is worth solving their NNLS problems in parallel
+
     """
 	Constructs a new collation_factorizer with the given settings.
 	"""
@@ -19,73 +168,168 @@ class collation_factorizer():
         self.collation_parser = collation_parser # internal instance of the parser for the input collation data to be factorized
         self.verbose = verbose # flag indicating whether or not to print timing and debugging details for the user
         self.rank = 1 # number of latent groups
-        self.factorizer = nf.Lsnmf(self.collation_parser.collation_matrix, seed="nndsvd", max_iter=10, rank=self.rank, track_error=True) # NMF least-squares factorizer to be applied to the collation matrix
+        self.cluster_labels = ["Cluster %d" % r for r in range(1, self.rank + 1)] # labels for the latent groups, used in the output tables
+        self.factorizer = None # NMF coordinate-descent factorizer (minimizing the least-squares reconstruction error) to be applied to the collation matrix; it is created when factorization is performed
         self.fit_summary = {} # dictionary of NMF fitness and performance metrics keyed by name
         self.basis_factor = np.zeros((len(self.collation_parser.readings), self.rank)) # "profile" (readings x rank) factor matrix
         self.coef_factor = np.zeros((self.rank, len(self.collation_parser.witnesses))) # "mixture" (rank x witnesses) factor matrix
         self.fragmentary_coef_factor = np.zeros((self.rank, len(self.collation_parser.fragmentary_witnesses))) # "mixture" (rank x fragmentary_witnesses) factor matrix for fragmentary witnesses
+        self.collation_svd = None # cached thin singular value decomposition (U, S, Vt) of the collation matrix, used to seed factorizations of any rank
 
     """
     Performs rank estimation on the primary collation matrix for the ranks in the given range.
     Optionally, a number of trials to run for each rank can be specified.
+    Each trial sweeps through the ranks in order, warm-starting the factorization for each rank from the solution for the previous rank.
     The output is a list of rank estimation results (in dictionary form).
     """
     def estimate_rank(self, min_rank, max_rank, n_run=10):
+        from scipy.cluster import hierarchy # for hierarchical clustering of the consensus matrices; imported here, as it is slow to load
+        from scipy.spatial.distance import squareform
+        from threadpoolctl import threadpool_limits # for keeping parallel trials from oversubscribing the CPUs with BLAS threads; installed with scikit-learn
         if self.verbose:
             print("Estimating rank in range [%d, %d] using %d trials for each rank (this may take some time)..." % (min_rank, max_rank, n_run))
         t0 = time.time()
+        collation_matrix = self.collation_parser.collation_matrix
+        n_witnesses = collation_matrix.shape[1]
+        ranks = range(min_rank, max_rank + 1)
+        # Give each trial its own independent stream of random numbers:
+        trial_seeds = np.random.SeedSequence().spawn(n_run)
+        # The trials are independent, so if there is more than one, run them in parallel in worker processes, each limited to a single BLAS thread:
+        n_workers = min(os.cpu_count() or 1, n_run)
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=threadpool_limits, initargs=(1,)) as executor:
+                trials_results = list(executor.map(run_rank_estimation_trial, [collation_matrix] * n_run, [ranks] * n_run, trial_seeds))
+        else:
+            trials_results = [run_rank_estimation_trial(collation_matrix, ranks, trial_seed) for trial_seed in trial_seeds]
         rank_metrics = []
-        metrics = ["cophenetic", "rss", "evar", "sparseness"]
-        # For rank estimation, use random seeding and a small number of iterations:
-        self.factorizer = nf.Lsnmf(self.collation_parser.collation_matrix, seed="random_vcol", max_iter=10, rank=self.rank, track_error=True)
-        rank_est_dict = self.factorizer.estimate_rank(rank_range=range(min_rank, max_rank + 1), what=metrics, n_run=n_run) # evaluate the specified metrics for each rank
-        for r in range(min_rank, max_rank + 1):
-            rank_est_metrics = rank_est_dict[r]
-            rank_metric_dict = {}
-            for metric in metrics:
-                rank_metric_dict["rank"] = r
-                if metric == "sparseness":
-                    # Separate the sparseness coefficients into their own named entries:
-                    rank_metric_dict["basis_sparseness"] = rank_est_metrics[metric][0]
-                    rank_metric_dict["mixture_sparseness"] = rank_est_metrics[metric][1]
-                else:
-                    rank_metric_dict[metric] = rank_est_metrics[metric]
-            rank_metrics.append(rank_metric_dict)
+        for i, r in enumerate(ranks):
+            # Report the metrics of the trial with the smallest residual,
+            # and build a consensus matrix of how often each pair of witnesses is assigned to the same group across trials:
+            best_metrics = None
+            consensus_matrix = np.zeros((n_witnesses, n_witnesses))
+            for trial_results in trials_results:
+                witness_groups, metrics = trial_results[i]
+                consensus_matrix += witness_groups[:, np.newaxis] == witness_groups[np.newaxis, :]
+                if best_metrics is None or metrics[0] < best_metrics[0]:
+                    best_metrics = metrics
+            # The cophenetic correlation measures how well an average-linkage clustering of the witnesses by their consensus agrees with the consensus itself:
+            consensus_dists = squareform(1 - consensus_matrix / n_run, checks=False)
+            cophenetic = hierarchy.cophenet(hierarchy.linkage(consensus_dists, method="average"), consensus_dists)[0]
+            rss, evar, basis_sparseness, mixture_sparseness = best_metrics
+            rank_metrics.append({"rank": r, "cophenetic": cophenetic, "rss": rss, "evar": evar, "basis_sparseness": basis_sparseness, "mixture_sparseness": mixture_sparseness})
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
         return rank_metrics
 
+    """
+    Returns the non-negative double singular value decomposition (NNDSVD) initialization (Boutsidis and Gallopoulos 2008) of the given rank for the collation matrix.
+    The singular triplets behind it are cached, so that seeds of the same or lower rank can be truncated from them.
+    """
+    def get_nndsvd_seed(self, rank):
+        import scipy as sp # for sparse matrix support; imported here, as it is slow to load
+        if self.collation_svd is None or len(self.collation_svd[1]) < rank:
+            collation_matrix = self.collation_parser.collation_matrix
+            if sp.sparse.issparse(collation_matrix) and rank < min(collation_matrix.shape) - 1:
+                # Compute just the leading singular triplets from the sparse matrix, without densifying it
+                # (the sparse solver does not return them in any particular order, so sort them by decreasing singular value):
+                U, S, Vt = sp.sparse.linalg.svds(collation_matrix.astype(np.float64), k=rank)
+                order = np.argsort(S)[::-1]
+                self.collation_svd = (U[:, order], S[order], Vt[order, :])
+            else:
+                if sp.sparse.issparse(collation_matrix):
+                    collation_matrix = collation_matrix.toarray()
+                self.collation_svd = np.linalg.svd(np.asarray(collation_matrix), full_matrices=False)
+        U, S, Vt = self.collation_svd
+        W = np.zeros((U.shape[0], rank))
+        H = np.zeros((rank, Vt.shape[1]))
+        # The leading singular triplet can be chosen to be non-negative:
+        W[:, 0] = np.sqrt(S[0]) * np.abs(U[:, 0])
+        H[0, :] = np.sqrt(S[0]) * np.abs(Vt[0, :])
+        # For each subsequent triplet, use whichever of its positive or negative sections is dominant:
+        for i in range(1, rank):
+            x, y = U[:, i], Vt[i, :]
+            x_pos, y_pos = np.maximum(x, 0), np.maximum(y, 0)
+            x_neg, y_neg = np.maximum(-x, 0), np.maximum(-y, 0)
+            x_pos_norm, y_pos_norm = np.linalg.norm(x_pos), np.linalg.norm(y_pos)
+            x_neg_norm, y_neg_norm = np.linalg.norm(x_neg), np.linalg.norm(y_neg)
+            pos_norm, neg_norm = x_pos_norm * y_pos_norm, x_neg_norm * y_neg_norm
+            if pos_norm == 0 and neg_norm == 0:
+                continue
+            if pos_norm > neg_norm:
+                u, v, sigma = x_pos / x_pos_norm, y_pos / y_pos_norm, pos_norm
+            else:
+                u, v, sigma = x_neg / x_neg_norm, y_neg / y_neg_norm, neg_norm
+            W[:, i] = np.sqrt(S[i] * sigma) * u
+            H[i, :] = np.sqrt(S[i] * sigma) * v
+        W[W < 1e-11] = 0
+        H[H < 1e-11] = 0
+        return W, H
+
     """
     Factors the collation into factors of a given rank using NMF
     and finds the optimal mixture coefficients for fragmentary witnesses using the best-found basis matrix.
     The best-found factors are stored internally.
     """
     def factorize_collation(self, rank):
+        from sklearn.decomposition import NMF # for performing non-negative matrix factorization (NMF); imported here, as it is slow to load
+        import scipy as sp # for solving optimization problems behind classifying lacunose witnesses; imported here, as it is slow to load
         if self.verbose:
             print("Factorizing collation matrix into factors of rank %d..." % rank)
         t0 = time.time()
-        # For factorization, use NNDSVD seeding and a larger number of iterations:
+        # For factorization, use NNDSVD seeding (computed from the cached SVD of the collation matrix) and run coordinate descent to convergence:
         self.rank = rank
-        self.factorizer = nf.Lsnmf(self.collation_parser.collation_matrix, seed="nndsvd", max_iter=100, rank=self.rank, track_error=True)
-        nmf_fit = self.factorizer()
+        self.cluster_labels = ["Cluster %d" % r for r in range(1, self.rank + 1)]
+        collation_matrix = self.collation_parser.collation_matrix
+        W_init, H_init = self.get_nndsvd_seed(self.rank)
+        self.factorizer = NMF(n_components=self.rank, init="custom", solver="cd", max_iter=200, tol=1e-4)
+        W = self.factorizer.fit_transform(collation_matrix, W=W_init.astype(collation_matrix.dtype), H=H_init.astype(collation_matrix.dtype))
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
-        # Populate the fitness and performance metrics:
-        self.fit_summary = {"rank": self.rank, "time (s)": t1 - t0, "n_iter": nmf_fit.fit.n_iter, "rss": nmf_fit.fit.rss(), "evar": nmf_fit.fit.evar(), "basis_sparseness": nmf_fit.fit.sparseness()[0], "mixture_sparseness": nmf_fit.fit.sparseness()[1]}
         # Get the factor matrices:
-        self.basis_factor = nmf_fit.basis()
-        self.coef_factor = nmf_fit.coef()
+        # (store them as double-precision arrays, keeping the basis factor in column-major order so that solvers that work on its columns can use it without copying it)
+        self.basis_factor = np.asfortranarray(W, dtype=np.float64)
+        self.coef_factor = np.asarray(self.factorizer.components_, dtype=np.float64)
+        # Populate the fitness and performance metrics:
+        rss, evar, basis_sparseness, mixture_sparseness = get_fit_metrics(collation_matrix, self.basis_factor, self.coef_factor)
+        self.fit_summary = {"rank": self.rank, "time (s)": t1 - t0, "n_iter": self.factorizer.n_iter_, "rss": rss, "evar": evar, "basis_sparseness": basis_sparseness, "mixture_sparseness": mixture_sparseness}
         # Then evaluate the mixture coefficients for the fragmentary witnesses using non-negative least squares (NNLS) optimization with the basis factor:
         if self.verbose:
             print("Finding optimal mixture coefficients for fragmentary witnesses...")
         t0 = time.time()
-        self.fragmentary_coef_factor = np.zeros((self.rank, len(self.collation_parser.fragmentary_witnesses)))
-        for j in range(len(self.collation_parser.fragmentary_witnesses)):
-            witness_vector = np.array([self.collation_parser.fragmentary_collation_matrix[i, j] for i in range(len(self.collation_parser.readings))]) # because for some reason, numpy.ndarray.flatten() leaves the column slice as a 2D array
-            witness_coefs, rnorm = sp.optimize.nnls(self.basis_factor, witness_vector)
-            self.fragmentary_coef_factor[:, j] = witness_coefs[:]
+        n_fragmentary_witnesses = len(self.collation_parser.fragmentary_witnesses)
+        if n_fragmentary_witnesses == 0:
+            self.fragmentary_coef_factor = np.zeros((self.rank, 0))
+        else:
+            # The basis factor is shared by every fragmentary witness, so compute its Gram matrix and its products with all witness vectors once:
+            fragmentary_collation_matrix = sp.sparse.csc_matrix(self.collation_parser.fragmentary_collation_matrix) # column slicing is efficient in CSC format
+            # A witness with no readings left in the matrix (e.g., because all of its readings were removed with readings unattested among the primary witnesses)
+            # trivially has zero coefficients, so only solve for the other witnesses:
+            self.fragmentary_coef_factor = np.zeros((self.rank, n_fragmentary_witnesses))
+            nonempty_cols = np.flatnonzero(np.asarray(fragmentary_collation_matrix.sum(axis=0)).ravel() > 0)
+            AtA = self.basis_factor.T @ self.basis_factor
+            AtB = np.ascontiguousarray((fragmentary_collation_matrix[:, nonempty_cols].T @ self.basis_factor).T) # sparse-times-dense product, so the witness vectors are never densified
+            # Solve the unconstrained least squares problems for all witnesses at once;
+            # any witness whose unconstrained solution is already non-negative needs no further work, since that solution is optimal for NNLS as well:
+            fragmentary_coefs = np.linalg.lstsq(AtA, AtB, rcond=None)[0]
+            infeasible_cols = np.flatnonzero((fragmentary_coefs < 0).any(axis=0))
+            # The remaining problems are independent, so if there are enough of them (and Numba is not available to parallelize them), split them across worker processes:
+            n_workers = os.cpu_count() or 1
+            converged = np.ones(len(infeasible_cols), dtype=bool)
+            if nb is None and n_workers > 1 and len(infeasible_cols) >= self.min_parallel_nnls_witnesses:
+                AtB_blocks = np.array_split(AtB[:, infeasible_cols], n_workers, axis=1)
+                with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                    block_results = list(executor.map(fnnls_block, [AtA] * len(AtB_blocks), AtB_blocks))
+                fragmentary_coefs[:, infeasible_cols] = np.hstack([X for X, block_converged in block_results])
+                converged = np.concatenate([block_converged for X, block_converged in block_results])
+            elif len(infeasible_cols) > 0:
+                fragmentary_coefs[:, infeasible_cols], converged = fnnls_block(AtA, AtB[:, infeasible_cols])
+            # If fnnls did not converge for any witnesses, then fall back to the bounded-variable least squares (BVLS) solver for them:
+            for j in infeasible_cols[~converged]:
+                witness_vector = fragmentary_collation_matrix[:, [nonempty_cols[j]]].toarray().ravel()
+                fragmentary_coefs[:, j] = sp.optimize.lsq_linear(self.basis_factor, witness_vector, bounds=(0, np.inf), method="bvls").x
+            self.fragmentary_coef_factor[:, nonempty_cols] = fragmentary_coefs
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
@@ -95,47 +339,49 @@ class collation_factorizer():
     Writes the NMF factors and the fragmentary witness mixture coefficients for the current rank to a specified Excel file.
     """
     def to_excel(self, output_addr):
-        # Then convert the NumPy collation matrix to a Pandas DataFrame:
+        import xlsxwriter # for writing output to Excel; imported here, as it is only needed for this output format
         if self.verbose:
             print("Writing NMF results to Excel...")
         t0 = time.time()
-        # First, convert all NumPy matrices to Pandas DataFrames:
-        fit_summary_df = pd.DataFrame(data=[self.fit_summary])
-        basis_factor_df = pd.DataFrame(data=self.basis_factor, index=self.collation_parser.readings, columns=["Cluster " + str(r) for r in range(1, self.rank + 1)])
-        coef_factor_df = pd.DataFrame(data=self.coef_factor, index=["Cluster " + str(r) for r in range(1, self.rank + 1)], columns=self.collation_parser.witnesses)
-        fragmentary_coef_factor_df = pd.DataFrame(data=self.fragmentary_coef_factor, index=["Cluster " + str(r) for r in range(1, self.rank + 1)], columns=self.collation_parser.fragmentary_witnesses)
-        #Then write them to separate sheets in the Excel output:
-        writer = pd.ExcelWriter(output_addr)
-        fit_summary_df.to_excel(writer, sheet_name="Summary", index=False)
-        basis_factor_df.to_excel(writer, sheet_name="Group Profiles")
-        coef_factor_df.to_excel(writer, sheet_name="Witness Groupings")
-        fragmentary_coef_factor_df.to_excel(writer, sheet_name="Fragmentary Witness Groups")
-        writer.save()
+        # Write the fit summary and each factor matrix to a separate sheet, streaming the rows straight from the NumPy matrices:
+        workbook = xlsxwriter.Workbook(output_addr, {"constant_memory": True}) # in constant memory mode, each row is flushed to disk once the next one is started
+        header_format = workbook.add_format({"bold": True})
+        worksheet = workbook.add_worksheet("Summary")
+        worksheet.write_row(0, 0, list(self.fit_summary.keys()), header_format)
+        # Leave undefined metrics (e.g., the mixture sparseness at rank 1) blank, as xlsxwriter cannot write NaN or infinite numbers:
+        worksheet.write_row(1, 0, [None if isinstance(value, float) and not np.isfinite(value) else value for value in self.fit_summary.values()])
+        factor_sheets = [
+            ("Group Profiles", self.collation_parser.readings, self.cluster_labels, self.basis_factor),
+            ("Witness Groupings", self.cluster_labels, self.collation_parser.witnesses, self.coef_factor),
+            ("Fragmentary Witness Groups", self.cluster_labels, self.collation_parser.fragmentary_witnesses, self.fragmentary_coef_factor)
+        ]
+        for sheet_name, row_labels, col_labels, factor in factor_sheets:
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 1, col_labels, header_format)
+            for i, row in enumerate(np.asarray(factor).tolist()):
+                worksheet.write_string(i + 1, 0, row_labels[i], header_format)
+                worksheet.write_row(i + 1, 1, row)
+        workbook.close()
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
         return
 
     """
-    Writes the NMF factors and the fragmentary witness mixture coefficients for the current rank to JSON strings.
-    A dictionary mapping each table's name to its JSON serialization is returned.
+    Writes the NMF factors and the fragmentary witness mixture coefficients for the current rank to a JSON string.
+    The JSON object returned maps each table's name to its rows, serialized as records mapping column labels to values.
     """
     def to_json(self):
-        # Then convert the NumPy collation matrix to a Pandas DataFrame:
+        import orjson # for writing output to JSON; imported here, as it is only needed for this output format
         if self.verbose:
             print("Writing basis and mixture matrix factors to JSON...")
         t0 = time.time()
-        # First, convert all NumPy matrices to Pandas DataFrames:
-        fit_summary_df = pd.DataFrame(data=[self.fit_summary])
-        basis_factor_df = pd.DataFrame(data=self.basis_factor, index=self.collation_parser.readings, columns=["Cluster " + str(r) for r in range(1, self.rank + 1)])
-        coef_factor_df = pd.DataFrame(data=self.coef_factor, index=["Cluster " + str(r) for r in range(1, self.rank + 1)], columns=self.collation_parser.witnesses)
-        fragmentary_coef_factor_df = pd.DataFrame(data=self.fragmentary_coef_factor, index=["Cluster " + str(r) for r in range(1, self.rank + 1)], columns=self.collation_parser.fragmentary_witnesses)
-        #Then combine their JSON serializations in a JSON object:
-        fit_summary_json = fit_summary_df.to_json(orient="records")
-        basis_factor_json = basis_factor_df.to_json(orient="records")
-        coef_factor_json = coef_factor_df.to_json(orient="records")
-        fragmentary_coef_factor_json = fragmentary_coef_factor_df.to_json(orient="records")
-        json_output = json.dumps({"Group Profiles": basis_factor_json, "Witness Groupings": coef_factor_json, "Fragmentary Witness Groups": fragmentary_coef_factor_json})
+        # Convert each factor matrix (in single precision, which is plenty for output) to a list of records mapping column labels to values,
+        # and serialize them all in one JSON object:
+        basis_factor_records = [dict(zip(self.cluster_labels, row)) for row in np.asarray(self.basis_factor, dtype=np.float32)]
+        coef_factor_records = [dict(zip(self.collation_parser.witnesses, row)) for row in np.asarray(self.coef_factor, dtype=np.float32)]
+        fragmentary_coef_factor_records = [dict(zip(self.collation_parser.fragmentary_witnesses, row)) for row in np.asarray(self.fragmentary_coef_factor, dtype=np.float32)]
+        json_output = orjson.dumps({"Group Profiles": basis_factor_records, "Witness Groupings": coef_factor_records, "Fragmentary Witness Groups": fragmentary_coef_factor_records}, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
@@ -1,17 +1,49 @@
 #!/usr/bin/env python3
 
 import time # to time calculations for users
+import contextlib # for closing VMR responses along with the files that wrap them
+import math # for rounding the minimum extant readings threshold up
+import os # for counting available CPUs and locating the VMR response cache
+import hashlib # for naming cached VMR responses
+import gzip # for compressing cached VMR responses
+import shutil # for copying VMR responses into the cache
+import tempfile # for downloading VMR responses into the cache atomically
 import re # for parsing augmented witness sigla
+from concurrent.futures import ProcessPoolExecutor # for parsing large collations in parallel
 from lxml import etree as et # for reading TEI XML inputs
 import urllib.request # for making HTTP requests to the VMR API
+import urllib.error # for handling HTTP errors and unmodified responses from the VMR API
 import numpy as np # matrix support
-from sklearn.feature_extraction.text import TfidfTransformer # for reweighting the entries of the input collation matrix to isolated better-separated clusters
+import scipy as sp # sparse matrix support
 from common import * # import all variables from the common support module
 
+"""
+XML parser for the serialized variation units parsed in worker processes;
+the units carry no ID references and may be very large, so skip building an ID table and lift libxml2's size limits.
+"""
+unit_xml_parser = et.XMLParser(collect_ids=False, huge_tree=True)
+
+"""
+Given a collation parser class, the settings to construct it with, the name of its method for parsing a single variation unit, and a list of serialized XML elements for variation units,
+parses the units with a new parser and returns the reading labels and witness sigla it encountered (in order of first appearance)
+and its lists of collation matrix entries, whose row and column indices refer to these lists.
+This runs in a worker process, so only the parser's settings (and not the entries it has accumulated so far) are sent to it.
+"""
+def parse_unit_chunk(parser_class, parser_settings, parse_method_name, unit_strs):
+    parser = parser_class(*parser_settings)
+    parser.reset_entries()
+    parse_unit = getattr(parser, parse_method_name)
+    for unit_str in unit_strs:
+        parse_unit(et.fromstring(unit_str, unit_xml_parser))
+    return list(parser.rows_by_reading), list(parser.cols_by_witness), parser.row_inds, parser.col_inds, parser.coefficients
+
 """
 Base class for reading collation data and reformatting it as a matrix according to customizable rules.
 """
 class collation_parser():
+    base_wit_suffix_regexes = [] # regular expressions for any suffixes besides the user-specified subwitness suffixes that should be stripped from witness sigla
+    min_parallel_units = 1000 # minimum number of variation units for which parsing is split across worker processes
+    
     """
 	Constructs a new collation_parser with the given settings.
 	"""
@@ -21,14 +53,97 @@ class collation_parser():
         self.use_tfidf = use_tfidf # flag indicating whether or not to weigh the final matrix by term frequency-inverse document frequency (TF-IDF)
         self.ambiguous_rdg_prefix = ambiguous_rdg_prefix # prefix used for ambiguous reading numbers (e.g., "W" or "zw-")
         self.subwitness_suffixes = subwitness_suffixes # list of suffixes used to distinguish subwitnesses like first hands, correctors, main texts, alternate texts, and multiple attestations from their base witnesses
+        suffix_regexes = [re.escape(suffix) for suffix in subwitness_suffixes if suffix != ""] + self.base_wit_suffix_regexes
+        self.subwitness_suffix_pattern = re.compile("(?:%s)+$" % "|".join(suffix_regexes)) if len(suffix_regexes) > 0 else None # pattern matching any sequence of suffixes at the end of a witness siglum
+        self.base_wits_by_siglum = {} # cache mapping witness sigla to their base sigla, as the same sigla recur in every variation unit
         self.trivial_reading_types = set(trivial_reading_types) # set of reading types (e.g., defective, orthographic, nomSac) whose readings should be collapsed under the previous substantive reading
         self.ignored_reading_types = set(ignored_reading_types) # set of reading types (e.g., lacunose, ambiguous) whose readings should not be included in the matrix
         self.verbose = verbose # flag indicating whether or not to print timing and debugging details for the user
         self.readings = [] # a list of variant reading labels (i.e., the row labels of the matrix)
         self.witnesses = [] # a list of witness sigla (i.e., the column labels of the matrix)
-        self.collation_matrix = np.zeros(shape=(len(self.readings), len(self.witnesses)))
+        self.collation_matrix = sp.sparse.csr_matrix((len(self.readings), len(self.witnesses)), dtype=np.float32) # a sparse (readings x witnesses) matrix, as each witness has at most a few readings at each variation unit
         self.fragmentary_witnesses = [] # a list of witnesses with fewer than min_extant extant readings
-        self.fragmentary_collation_matrix = np.zeros(shape=(len(self.readings), len(self.fragmentary_witnesses)))
+        self.fragmentary_collation_matrix = sp.sparse.csr_matrix((len(self.readings), len(self.fragmentary_witnesses)), dtype=np.float32)
+
+    """
+    Returns the settings this parser was constructed with, as a tuple of constructor arguments (with verbose output disabled),
+    so that an equivalent parser can be constructed in a worker process.
+    """
+    def get_settings(self):
+        return (self.min_extant_proportion, self.use_tfidf, self.ambiguous_rdg_prefix, self.subwitness_suffixes, list(self.trivial_reading_types), list(self.ignored_reading_types), False)
+
+    """
+    Reinitializes the dictionaries mapping readings and witnesses to row and column indices (in order of first appearance) and the lists of collation matrix entries.
+    """
+    def reset_entries(self):
+        self.rows_by_reading = {} # a dictionary mapping variant reading labels to their corresponding row indices
+        self.cols_by_witness = {} # a dictionary mapping base witness sigla to their corresponding column indices
+        self.row_inds = []
+        self.col_inds = []
+        self.coefficients = []
+        return
+
+    """
+    Given an iterable of XML elements for variation units and the name of the method for parsing a single unit, 
+    parses all of the units into the reading and witness index dictionaries and the lists of collation matrix entries, and returns the number of units parsed.
+    Each unit is processed before the next one is drawn, so the iterable may free the elements it has already yielded.
+    The first min_parallel_units units are parsed directly; any remaining units are split into contiguous chunks that are parsed in worker processes,
+    and their results are merged in document order, so the output is the same as that of parsing the units one at a time.
+    """
+    def parse_units(self, units, parse_method_name):
+        self.reset_entries()
+        n_workers = os.cpu_count() or 1
+        parse_unit = getattr(self, parse_method_name)
+        units = iter(units)
+        n_units = 0
+        for unit in units:
+            parse_unit(unit)
+            n_units += 1
+            if n_workers > 1 and n_units >= self.min_parallel_units:
+                break
+        # Serialize any remaining units, since lxml elements cannot be sent to other processes, and split them into one chunk per worker:
+        unit_strs = [et.tostring(unit, with_tail=False) for unit in units]
+        if len(unit_strs) == 0:
+            return n_units
+        n_units += len(unit_strs)
+        chunk_size = -(-len(unit_strs) // n_workers)
+        chunks = [unit_strs[k:k + chunk_size] for k in range(0, len(unit_strs), chunk_size)]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chunk_results = list(executor.map(parse_unit_chunk, [type(self)] * len(chunks), [self.get_settings()] * len(chunks), [parse_method_name] * len(chunks), chunks))
+        # Then map each chunk's local row and column indices to global ones, assigning new indices in order of first appearance:
+        for readings, witnesses, row_inds, col_inds, coefficients in chunk_results:
+            row_map = np.array([self.rows_by_reading.setdefault(rdg, len(self.rows_by_reading)) for rdg in readings], dtype=np.int64)
+            col_map = np.array([self.cols_by_witness.setdefault(wit, len(self.cols_by_witness)) for wit in witnesses], dtype=np.int64)
+            self.row_inds.extend(row_map[np.asarray(row_inds, dtype=np.int64)].tolist())
+            self.col_inds.extend(col_map[np.asarray(col_inds, dtype=np.int64)].tolist())
+            self.coefficients.extend(coefficients)
+        return n_units
+
+    """
+    Sets the minimum extant readings threshold to the given proportion of the given number of variation units, rounded up,
+    so that a witness is never admitted to the primary collation matrix with fewer extant readings than the proportion requires.
+    """
+    def set_min_extant(self, n_units):
+        # Subtract a small tolerance before rounding up, so that products that should be whole numbers (e.g., 0.07 * 100) are not bumped up by floating-point error:
+        self.min_extant = math.ceil(self.min_extant_proportion * n_units - 1e-9)
+        return
+
+    """
+    Recovers the reading and witness lists from the keys of the index dictionaries, which preserve insertion order, 
+    and assembles the collation matrix from the lists of collation matrix entries in a single step, releasing the entry lists afterward.
+    """
+    def assemble_collation_matrix(self):
+        self.readings = list(self.rows_by_reading)
+        self.witnesses = list(self.cols_by_witness)
+        n_entries = len(self.coefficients)
+        row_inds = np.fromiter(self.row_inds, dtype=np.int32, count=n_entries)
+        col_inds = np.fromiter(self.col_inds, dtype=np.int32, count=n_entries)
+        coefficients = np.fromiter(self.coefficients, dtype=np.float32, count=n_entries)
+        self.collation_matrix = sp.sparse.coo_matrix((coefficients, (row_inds, col_inds)), shape=(len(self.readings), len(self.witnesses))).tocsr()
+        self.row_inds = []
+        self.col_inds = []
+        self.coefficients = []
+        return
 
     """
     Postprocesses the collation matrix, moving columns whose coefficients sum below the min_extant threshold to the fragmentary witnesses collation matrix
@@ -39,21 +154,19 @@ class collation_parser():
             print("Filtering for witnesses with at least %d extant passages..." % self.min_extant)
         t0 = time.time()
         # Calculate the column sums of the initial collation matrix:
-        col_sums = np.sum(self.collation_matrix, axis=0)
+        col_sums = np.asarray(self.collation_matrix.sum(axis=0, dtype=np.float64)).ravel() # accumulate in double precision so that fractional coefficients do not drift across the threshold
         # Then reduce the witnesses list and collation matrix to include just the witnesses that this threshold:
-        sufficient_col_inds = [j for j in range(len(self.witnesses)) if col_sums[j] >= self.min_extant]
-        fragmentary_col_inds = [j for j in range(len(self.witnesses)) if col_sums[j] < self.min_extant]
-        sufficient_witnesses = [self.witnesses[j] for j in sufficient_col_inds]
-        fragmentary_witnesses = [self.witnesses[j] for j in fragmentary_col_inds]
-        self.witnesses = sufficient_witnesses
-        self.fragmentary_witnesses = fragmentary_witnesses
-        self.fragmentary_collation_matrix = self.collation_matrix[:, fragmentary_col_inds]
-        self.collation_matrix = self.collation_matrix[:, sufficient_col_inds]
+        sufficient_col_mask = col_sums >= self.min_extant
+        self.fragmentary_witnesses = [wit for wit, is_sufficient in zip(self.witnesses, sufficient_col_mask) if not is_sufficient]
+        self.witnesses = [wit for wit, is_sufficient in zip(self.witnesses, sufficient_col_mask) if is_sufficient]
+        collation_matrix_by_col = self.collation_matrix.tocsc() # column slicing is efficient in CSC format
+        self.fragmentary_collation_matrix = collation_matrix_by_col[:, np.flatnonzero(~sufficient_col_mask)].tocsr()
+        self.collation_matrix = collation_matrix_by_col[:, np.flatnonzero(sufficient_col_mask)].tocsr()
         # Now ensure that any readings that are no longer attested among the non-fragmentary witnesses have their rows removed from both matrices:
-        row_sums = np.sum(self.collation_matrix, axis=1)
-        preserved_row_inds = [i for i in range(len(self.readings)) if row_sums[i] > 0]
-        preserved_readings = [self.readings[i] for i in preserved_row_inds]
-        self.readings = preserved_readings
+        row_sums = np.asarray(self.collation_matrix.sum(axis=1, dtype=np.float64)).ravel()
+        preserved_row_mask = row_sums > 0
+        preserved_row_inds = np.flatnonzero(preserved_row_mask)
+        self.readings = [rdg for rdg, is_preserved in zip(self.readings, preserved_row_mask) if is_preserved]
         self.collation_matrix = self.collation_matrix[preserved_row_inds, :]
         self.fragmentary_collation_matrix = self.fragmentary_collation_matrix[preserved_row_inds, :]
         t1 = time.time()
@@ -64,13 +177,17 @@ class collation_parser():
             if self.verbose:
                 print("Applying TF-IDF reweighting...")
             t0 = time.time()
-            tfidf_trans = TfidfTransformer(norm=None, smooth_idf=False) # smooth_idf is not needed, since we've removed all rows that sum to 0, thereby avoiding division by 0
             if self.collation_matrix.shape != (0,0):
-                tfidf_trans.fit(self.collation_matrix.T) # fit the transformer only to the non-fragmentary data; we transpose our collation matrix, as scikitlearn expects terms to be in columns and documents in rows
-                tfidf_trans.idf_ = tfidf_trans.idf_ - 1 # the TF-IDF transformer adds 1 to each entry; subtract it back out (common readings should be reweighted close to 0, not 1)
-                self.collation_matrix = tfidf_trans.transform(self.collation_matrix.T).todense().T
-                if self.fragmentary_collation_matrix.shape != (0,0):
-                    self.fragmentary_collation_matrix = tfidf_trans.transform(self.fragmentary_collation_matrix.T).todense().T
+                # Calculate the inverse document frequency of each reading from the non-fragmentary data only, treating witnesses as documents and readings as terms;
+                # no smoothing is needed, since we've removed all rows that sum to 0, thereby avoiding division by 0,
+                # and we use log(N / df) rather than the log(N / df) + 1 of some implementations, so that common readings are reweighted close to 0, not 1:
+                n_docs = self.collation_matrix.shape[1]
+                doc_freqs = self.collation_matrix.getnnz(axis=1)
+                idf = np.log(n_docs / doc_freqs).astype(np.float32)
+                # Then scale the rows of both matrices by these weights:
+                idf_diag = sp.sparse.diags(idf)
+                self.collation_matrix = (idf_diag @ self.collation_matrix).tocsr()
+                self.fragmentary_collation_matrix = (idf_diag @ self.fragmentary_collation_matrix).tocsr()
             # For each fragmentary witnesses, we weigh it readings as if it were the only witness added to the 
             t1 = time.time()
             if self.verbose:
@@ -81,246 +198,258 @@ class collation_parser():
 Derived class for reading collation data from a TEI XML file.
 """
 class tei_collation_parser(collation_parser):
+    rdg_tag = "{%s}rdg" % tei_ns
+
     """
     Given a witness siglum, returns the base siglum of the witness, stripped of all subwitness suffixes.
     """
     def get_base_wit(self, wit):
+        if wit in self.base_wits_by_siglum:
+            return self.base_wits_by_siglum[wit]
         base_wit = wit.strip("#") # if the witness siglum is a pointer to an xml:id attribute, remove the "#" prefix
-        while (True):
-            suffix_found = False
-            for suffix in self.subwitness_suffixes:
-                if base_wit.endswith(suffix):
-                    suffix_found = True
-                    base_wit = base_wit[:-len(suffix)]
-                    break
-            if not suffix_found:
-                break
+        if self.subwitness_suffix_pattern is not None:
+            base_wit = self.subwitness_suffix_pattern.sub("", base_wit)
+        self.base_wits_by_siglum[wit] = base_wit
         return base_wit
 
     """
-    Given the XML tree for an element, recursively serializes it in a more readable format.
+    Given the XML tree for an element, serializes it in a more readable format.
     """
     def serialize(self, xml):
+        parts = []
+        self.serialize_into(xml, parts)
+        return "".join(parts)
+
+    """
+    Given the XML tree for an element and a list of serialized text parts, recursively appends the parts of the element's serialization to the list.
+    """
+    def serialize_into(self, xml, parts):
         # Get the element tag:
         raw_tag = xml.tag.replace("{%s}" % tei_ns, "")
+        # Get its text and tail once, as lxml creates a new string on each access:
+        text = xml.text
+        tail = xml.tail
         # If it is a reading, then serialize its children, separated by spaces:
         if raw_tag == "rdg":
-            text = "" if xml.text is None else xml.text
-            text += " ".join([self.serialize(child) for child in xml])
-            return text
+            if text is not None:
+                parts.append(text)
+            self.serialize_children_into(xml, " ", parts)
+            return
         # If it is a word, abbreviation, or overline-rendered element, then serialize its text and tail, 
         # recursively processing any subelements:
         if raw_tag in ["w", "abbr", "hi"]:
-            text = "" if xml.text is None else xml.text
-            text += "".join([self.serialize(child) for child in xml])
-            text += "" if xml.tail is None else xml.tail
-            return text
+            if text is not None:
+                parts.append(text)
+            self.serialize_children_into(xml, "", parts)
+            if tail is not None:
+                parts.append(tail)
+            return
         # If it is a space, then serialize as a single space:
         if raw_tag == "space":
-            text = "["
-            text += "space"
-            if xml.get("reason") is not None:
-                text += " "
-                reason = xml.get("reason")
-                text += "(" + reason + ")"
-            if xml.get("unit") is not None and xml.get("extent") is not None:
-                text += ", "
-                unit = xml.get("unit")
-                extent = xml.get("extent")
-                text += extent + " " + unit
-            text += "]"
-            text += "" if xml.tail is None else xml.tail
-            return text
+            parts.append("[space")
+            reason = xml.get("reason")
+            if reason is not None:
+                parts.extend([" (", reason, ")"])
+            unit = xml.get("unit")
+            extent = xml.get("extent")
+            if unit is not None and extent is not None:
+                parts.extend([", ", extent, " ", unit])
+            parts.append("]")
+            if tail is not None:
+                parts.append(tail)
+            return
         # If it is an expansion, then serialize it in parentheses:
         if raw_tag == "ex":
-            text = ""
-            text += "("
-            text += "" if xml.text is None else xml.text
-            text += " ".join([self.serialize(child) for child in xml])
-            text += ")"
-            text += "" if xml.tail is None else xml.tail
-            return text
+            parts.append("(")
+            if text is not None:
+                parts.append(text)
+            self.serialize_children_into(xml, " ", parts)
+            parts.append(")")
+            if tail is not None:
+                parts.append(tail)
+            return
         # If it is a gap, then serialize it based on its attributes:
         if raw_tag == "gap":
-            text = ""
-            text += "["
-            text += "gap"
-            if xml.get("reason") is not None:
-                text += " "
-                reason = xml.get("reason")
-                text += "(" + reason + ")"
-                text += reason
-            if xml.get("unit") is not None and xml.get("extent") is not None:
-                text += ", "
-                unit = xml.get("unit")
-                extent = xml.get("extent")
-                text += extent + " " + unit
-            text += "]"
-            text += "" if xml.tail is None else xml.tail
-            return text
+            parts.append("[gap")
+            reason = xml.get("reason")
+            if reason is not None:
+                parts.extend([" (", reason, ")", reason])
+            unit = xml.get("unit")
+            extent = xml.get("extent")
+            if unit is not None and extent is not None:
+                parts.extend([", ", extent, " ", unit])
+            parts.append("]")
+            if tail is not None:
+                parts.append(tail)
+            return
         # If it is an unclear or supplied element, then recursively set the contents in brackets:
         if raw_tag in ["unclear", "supplied"]:
-            text = ""
-            text += "["
-            text += "" if xml.text is None else xml.text
-            text += " ".join([self.serialize(child) for child in xml])
-            text += "]"
-            text += "" if xml.tail is None else xml.tail
-            return text
+            parts.append("[")
+            if text is not None:
+                parts.append(text)
+            self.serialize_children_into(xml, " ", parts)
+            parts.append("]")
+            if tail is not None:
+                parts.append(tail)
+            return
         # If it is a choice element, then recursively set the contents in brackets, separated by slashes:
         if raw_tag == "choice":
-            text = ""
-            text += "["
-            text += "" if xml.text is None else xml.text
-            text += "/".join([self.serialize(child) for child in xml])
-            text += "]"
-            text += "" if xml.tail is None else xml.tail
-            return text
+            parts.append("[")
+            if text is not None:
+                parts.append(text)
+            self.serialize_children_into(xml, "/", parts)
+            parts.append("]")
+            if tail is not None:
+                parts.append(tail)
+            return
         # If it is a ref element, then set its text in brackets:
         if raw_tag == "ref":
-            text = ""
-            text += "["
-            text += "" if xml.text is None else xml.text
-            text += "]"
-            text += "" if xml.tail is None else xml.tail
-            return text
-        # For all other elements, return an empty string:
-        return ""
+            parts.append("[")
+            if text is not None:
+                parts.append(text)
+            parts.append("]")
+            if tail is not None:
+                parts.append(tail)
+            return
+        # For all other elements, append nothing:
+        return
+
+    """
+    Given the XML tree for an element, a separator string, and a list of serialized text parts, 
+    appends the serializations of the element's children, separated by the separator, to the list.
+    """
+    def serialize_children_into(self, xml, separator, parts):
+        for k, child in enumerate(xml):
+            if k > 0 and separator != "":
+                parts.append(separator)
+            self.serialize_into(child, parts)
+        return
         
+    """
+    Given a dictionary of reading coefficients and a string of witness sigla supporting the reading, 
+    appends the raw coefficient(s) for each base witness (or any of its subwitnesses) as (row, column, value) entries to the collation matrix entry lists.
+    """
+    def add_coefficients(self, rdg_coefficients, wit_str):
+        for wit in wit_str.split():
+            # Extract the base siglum for this witness:
+            base_wit = self.get_base_wit(wit)
+            # Get the column index for this witness, assigning it the next column if it has not yet appeared:
+            j = self.cols_by_witness.setdefault(base_wit, len(self.cols_by_witness))
+            # Then add an entry for each coefficient for this reading in this witness's column
+            # (entries for the same reading and base witness, such as those from multiple subwitnesses, are summed when the matrix is assembled):
+            for label in rdg_coefficients:
+                self.row_inds.append(self.rows_by_reading[label])
+                self.col_inds.append(j)
+                self.coefficients.append(rdg_coefficients[label])
+        return
+
     """
     Given a TEI XML <app/> element, parses the support for its readings, accounting for subwitness prefixes and reading types.
-    The output is a dictionary mapping each base witness to a dictionary of its raw coefficient(s) for the reading(s) it (or any of its subwitnesses) supports.
+    The raw coefficient(s) for the reading(s) each base witness (or any of its subwitnesses) supports are appended as (row, column, value) entries to the collation matrix entry lists.
     """
     def parse_app(self, xml):
-        readings_by_witness = {} # the output dictionary
         readings_by_number = {} # dictionary mapping reading numbers to their full labels
+        ambiguous_readings = [] # list of (reading number, coefficients dictionary) pairs for ambiguous readings, whose coefficients are filled in once all substantive readings have been seen
+        rdg_supports = [] # list of (coefficients dictionary, witness string, ambiguous flag) triples for the readings in document order
         # Get the ID or number of the variation unit:
-        app_id = ""
-        if xml.get("{%s}id" % xml_ns) is not None:
-            app_id = xml.get("{%s}id" % xml_ns)
-        elif xml.get("n") is not None:
-            app_id = xml.get("n")
+        app_id = xml.get("{%s}id" % xml_ns)
+        if app_id is None:
+            app_id = xml.get("n", "")
         if self.verbose:
             print("Parsing variation unit %s..." % app_id)
         t0 = time.time()
-        # In a first loop, populate the readings_by_number dictionary for substantive readings, and add reading labels to the readings list:
-        for rdg in xml.xpath("tei:rdg", namespaces={"tei": tei_ns}):
-            rdg_type = ""
-            if rdg.get("type") is not None:
-                rdg_type = rdg.get("type")
-            # If this reading is of an ignored or trivial type, then skip it:
-            if rdg_type in self.ignored_reading_types or rdg_type in self.trivial_reading_types:
-                continue
-            rdg_n = rdg.get("n")
-            rdg_text = self.serialize(rdg)
-            rdg_label = " ".join([app_id, rdg_n, rdg_text])
-            # Ambiguous readings should not be added to the readings list, 
-            # and their coefficients dictionaries will likely split the unit of support between multiple possible substantive readings:
-            if rdg_type != "ambiguous":
-                readings_by_number[rdg_n] = rdg_label
-                self.readings.append(rdg_label)
-        # In a second pass, update the reading coefficients dictionary for each substantive readings and add its value(s) to the reading support dictionaries of all supporting witnesses:
+        # In a single pass, assign each substantive reading a row and record the coefficients and witnesses of every reading;
+        # since ambiguous readings may refer to substantive readings that follow them, their coefficients are only resolved after the pass:
         rdg_coefficients = {}
-        for rdg in xml.xpath("tei:rdg", namespaces={"tei": tei_ns}):
-            rdg_type = ""
-            if rdg.get("type") is not None:
-                rdg_type = rdg.get("type")
+        for rdg in xml.iterchildren(self.rdg_tag):
+            rdg_type = rdg.get("type", "")
             # If this reading is of an ignored type, then skip it:
             if rdg_type in self.ignored_reading_types:
                 continue
-            # If this reading is not of a trivial type, then update the coefficients dictionary:
+            is_ambiguous = False
+            # If this reading is not of a trivial type, then update the coefficients dictionary
+            # (trivial readings share the coefficients dictionary of the last non-trivial reading):
             if rdg_type not in self.trivial_reading_types:
                 rdg_n = rdg.get("n")
-                rdg_text = self.serialize(rdg)
-                rdg_label = " ".join([app_id, rdg_n, rdg_text])
-                rdg_coefficients = {}
                 # Ambiguous readings should not be added to the readings list, 
                 # and their coefficients dictionaries will likely split the unit of support between multiple possible substantive readings:
                 if rdg_type == "ambiguous":
-                    # Following the ECM convention, possible readings are separated by forward slashes:
-                    possible_reading_numbers = rdg_n.strip(self.ambiguous_rdg_prefix).split("/")
-                    # Determine how many of these correspond to substantive readings:
-                    for possible_reading_number in possible_reading_numbers:
-                        if possible_reading_number in readings_by_number:
-                            rdg_coefficients[readings_by_number[possible_reading_number]] = 1
-                    # If the ambiguous reading corresponds to no substantive reading, then ignore it;
-                    # otherwise, normalize the coefficients to sum to 1:
-                    if len(rdg_coefficients) == 0:
-                        continue
-                    else:
-                        for label in rdg_coefficients:
-                            rdg_coefficients[label] = 1 / len(rdg_coefficients)
+                    is_ambiguous = True
+                    rdg_coefficients = {}
+                    ambiguous_readings.append((rdg_n, rdg_coefficients))
                 else:
-                    rdg_coefficients[rdg_label] = 1
-            # Now add the coefficients for this reading to the support dictionary of every witness supporting this reading:
-            if rdg.get("wit") is None:
+                    rdg_text = self.serialize(rdg)
+                    rdg_label = " ".join([app_id, rdg_n, rdg_text])
+                    readings_by_number[rdg_n] = rdg_label
+                    self.rows_by_reading.setdefault(rdg_label, len(self.rows_by_reading))
+                    rdg_coefficients = {rdg_label: 1}
+            wit_str = rdg.get("wit")
+            if wit_str is None:
                 continue
-            for wit in rdg.get("wit").split():
-                # Extract the base siglum for this witness:
-                base_wit = self.get_base_wit(wit)
-                # If the readings_by_witness dictionary doesn't have an entry for this witness yet, then create one:
-                if base_wit not in readings_by_witness:
-                    readings_by_witness[base_wit] = {}
-                # Then add the coefficient(s) for this reading to this witness's dictionary:
-                base_wit_coefficients = readings_by_witness[base_wit]
-                for label in rdg_coefficients:
-                    if label not in base_wit_coefficients:
-                        base_wit_coefficients[label] = 0
-                    base_wit_coefficients[label] += rdg_coefficients[label]
-                readings_by_witness[base_wit] = base_wit_coefficients
+            rdg_supports.append((rdg_coefficients, wit_str, is_ambiguous))
+        # Then fill in the coefficients of the ambiguous readings:
+        for rdg_n, rdg_coefficients in ambiguous_readings:
+            # Following the ECM convention, possible readings are separated by forward slashes:
+            possible_reading_numbers = rdg_n.strip(self.ambiguous_rdg_prefix).split("/")
+            # Determine how many of these correspond to substantive readings:
+            for possible_reading_number in possible_reading_numbers:
+                if possible_reading_number in readings_by_number:
+                    rdg_coefficients[readings_by_number[possible_reading_number]] = 1
+            # Normalize the coefficients to sum to 1:
+            for label in rdg_coefficients:
+                rdg_coefficients[label] = 1 / len(rdg_coefficients)
+        # Now add the coefficients for each reading to the collation matrix entries of every witness supporting it, in document order;
+        # an ambiguous reading that corresponds to no substantive reading is ignored, but the witnesses of any trivial readings under it are still counted:
+        for rdg_coefficients, wit_str, is_ambiguous in rdg_supports:
+            if is_ambiguous and len(rdg_coefficients) == 0:
+                continue
+            self.add_coefficients(rdg_coefficients, wit_str)
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
-        return readings_by_witness
+        return
+
+    """
+    Given a file address to an .xml file containing a TEI collation, streams its <app/> elements in document order (i.e., the order of their start tags, so that nested units follow the units that contain them),
+    freeing each top-level unit (and anything before it) once it and the units nested in it have been processed, so that the full tree is never held in memory.
+    """
+    def iterparse_apps(self, input_addr):
+        app_tag = "{%s}app" % tei_ns
+        pending_apps = [] # units in the current top-level unit, in the order of their start tags
+        depth = 0 # number of units whose start tags have been read but whose end tags have not
+        # (whitespace between elements is kept, as it is significant in the serialized readings)
+        for event, app in et.iterparse(input_addr, events=("start", "end"), tag=app_tag, collect_ids=False, huge_tree=True):
+            if event == "start":
+                pending_apps.append(app)
+                depth += 1
+                continue
+            depth -= 1
+            # Nested variation units are still needed to serialize the readings of the units that contain them,
+            # so wait until the end of the top-level unit, when it and all of the units nested in it are complete:
+            if depth > 0:
+                continue
+            yield from pending_apps
+            pending_apps = []
+            app.clear(keep_tail=True)
+            while app.getprevious() is not None:
+                del app.getparent()[0]
 
     """
     Given a file address to an .xml file containing a TEI collation, read its contents into a collation matrix and apply the appropriate postprocessing.
     """
     def read(self, input_addr):
-        # Parse the input XML document:
-        xml = et.parse(input_addr)
-        # Reinitialize the reading and witness lists:
-        self.readings = []
-        self.witnesses = []
-        # Populate them and a dictionary mapping witnesses to a dictionary of their reading coefficients, parsing one variation unit at a time:
+        # Populate the reading and witness index dictionaries and the lists of collation matrix entries, streaming and parsing one variation unit at a time:
         if self.verbose:
-            print("Parsing variation units in TEI XML tree...")
+            print("Parsing variation units in TEI XML file...")
         t0 = time.time()
-        readings_by_witness = {}
+        n_apps = self.parse_units(self.iterparse_apps(input_addr), "parse_app")
         # Set the minimum extant readings threshold based on the number of variation units in the input:
-        self.min_extant = int(self.min_extant_proportion * len(xml.xpath("//tei:app", namespaces={"tei": tei_ns})))
-        for app in xml.xpath("//tei:app", namespaces={"tei": tei_ns}):
-            readings_by_witness_for_app = self.parse_app(app)
-            # Proceed for every (base) witness accounted for in this unit:
-            for wit in readings_by_witness_for_app:
-                # If this witness has not yet appeared, then add it to the list and initialize its reading coefficient dictionary:
-                if wit not in readings_by_witness:
-                    self.witnesses.append(wit)
-                    readings_by_witness[wit] = {}
-                # Then add its coefficients for this unit to its reading coefficient dictionary:
-                wit_coefficients = readings_by_witness[wit]
-                wit_coefficients_for_app = readings_by_witness_for_app[wit]
-                for label in wit_coefficients_for_app:
-                    wit_coefficients[label] = wit_coefficients_for_app[label]
-                readings_by_witness[wit] = wit_coefficients
-        # Now populate the collation matrix, using dictionaries to map values to row and column indices:
-        rows_by_reading = {} # a dictionary mapping variant reading labels to their corresponding row indices
-        cols_by_witness = {} # a dictionary mapping base witness sigla to their corresponding column indices
-        for i, rdg in enumerate(self.readings):
-            rows_by_reading[rdg] = i
-        for j, wit in enumerate(self.witnesses):
-            cols_by_witness[wit] = j
-        self.collation_matrix = np.zeros(shape=(len(self.readings), len(self.witnesses)))
-        for wit in readings_by_witness:
-            j = cols_by_witness[wit]
-            wit_coefficients = readings_by_witness[wit]
-            for rdg in wit_coefficients:
-                i = rows_by_reading[rdg]
-                coefficient = wit_coefficients[rdg]
-                self.collation_matrix[i,j] = coefficient
+        self.set_min_extant(n_apps)
+        # Now assemble the collation matrix from its entries:
+        self.assemble_collation_matrix()
         t1 = time.time()
         if self.verbose:
-            print("Total time to parse all %d variation units: %0.4fs." % (len(xml.xpath("//tei:app", namespaces={"tei": tei_ns})), t1 - t0))
+            print("Total time to parse all %d variation units: %0.4fs." % (n_apps, t1 - t0))
         if self.verbose:
             print("Size of raw collation matrix: %d rows (readings), %d columns (witnesses)." % self.collation_matrix.shape)
         # Finally, postprocess this matrix:
@@ -335,56 +464,55 @@ Derived class for reading collation data from the INTF Virtual Manuscript Room (
 """
 class vmr_collation_parser(collation_parser):
     manuscript_witness_pattern = re.compile(r"^[PL]*\d+")
-    fehler_pattern = re.compile(r"f\d*$")
-    defective_rdg_pattern = re.compile(r"^[a-z]+f\d*$")
-    orthographic_rdg_pattern = re.compile(r"^[a-z]+o\d*$")
+    witness_with_parentheses_pattern = re.compile(r"(\S+)\(([^\(\)]*)\)")
+    bracket_translation_table = str.maketrans("", "", "[]>") # translation table that deletes square brackets and right angle brackets
+    base_wit_suffix_regexes = [r"f\d*", r"V"] # Fehler and et videtur suffixes
     overlap_rdg_label = "zu"
     ambiguous_rdg_label = "zw"
     lacunose_rdg_label = "zz"
+    cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "collation-nmf") # directory in which VMR responses are cached (set to None to disable caching)
+    cache_max_age = 86400 # number of seconds for which a cached VMR response without an ETag is reused without contacting the server
+    rdg_type_pattern = re.compile(r"^(?:(?P<lac>%s)|(?P<ambiguous>%s)|(?P<overlap>%s)|(?P<orthographic>[a-z]+o\d*)|(?P<defective>[a-z]+f\d*))$" % (lacunose_rdg_label, ambiguous_rdg_label, overlap_rdg_label)) # pattern whose matching group names the type of a reading with the given label
 
     """
-    Given a string of witness sigla, remove any square brackets around witness sigla.
-    """
-    def remove_square_brackets(self, wit_str):
-        debracketed_wit_str = wit_str.replace("[", "").replace("]", "")
-        return debracketed_wit_str
-
-    """
-    Given a string of witness sigla, remove any right angle brackets after versional witness sigla.
+    Given a string of witness sigla, remove any square brackets around witness sigla and any right angle brackets after versional witness sigla.
     """
-    def remove_angle_brackets(self, wit_str):
-        debracketed_wit_str = wit_str.replace(">", "")
+    def remove_brackets(self, wit_str):
+        debracketed_wit_str = wit_str.translate(self.bracket_translation_table)
         return debracketed_wit_str
 
     """
     Given a string of witness sigla, expand any base sigla followed by one or more suffixes in the same parentheses to the same sigla followed by each suffix
     """
     def expand_parenthetical_suffixes(self, wit_str):
-        expanded_wit_str = wit_str
-        witness_with_parentheses_pattern = re.compile(r"(\S+)\(([^\(\)]*)\)")
-        matches = witness_with_parentheses_pattern.findall(wit_str)
-        for match in matches:
-            wit = self.get_base_wit(match[0])
-            suffixes = match[1].replace(" ", "").split(",")
-            expanded_wits = []
-            for suffix in suffixes:
-                expanded_wit = wit + suffix
-                expanded_wits.append(expanded_wit)
-            expanded_wit_str = expanded_wit_str.replace(match[0] + "(" + match[1] + ")", " ".join(expanded_wits))
+        expanded_wit_str = self.witness_with_parentheses_pattern.sub(self.expand_parenthetical_match, wit_str)
         return expanded_wit_str
 
+    """
+    Given a match of a base siglum followed by one or more suffixes in parentheses, returns the sigla formed by the base siglum followed by each suffix, separated by spaces.
+    """
+    def expand_parenthetical_match(self, match):
+        wit = self.get_base_wit(match.group(1))
+        suffixes = match.group(2).replace(" ", "").split(",")
+        expanded_wits = []
+        for suffix in suffixes:
+            expanded_wit = wit + suffix
+            expanded_wits.append(expanded_wit)
+        return " ".join(expanded_wits)
+
     """
     Given a string of witness sigla, remove any "ms" and "mss" suffixes after patristic and versional witness sigla.
     """
     def remove_ms_mss_suffixes(self, wit_str):
-        reduced_sigla = wit_str.split()
-        for siglum in reduced_sigla:
+        reduced_sigla = []
+        for siglum in wit_str.split():
             # Only check this for non-manuscript witnesses:
             if not self.manuscript_witness_pattern.match(siglum):
                 if siglum.endswith("mss"):
                     siglum = siglum[:-3]
                 elif siglum.endswith("ms"):
                     siglum = siglum[:-2]
+            reduced_sigla.append(siglum)
         reduced_wit_str = " ".join(reduced_sigla)
         return reduced_wit_str
 
@@ -392,140 +520,194 @@ class vmr_collation_parser(collation_parser):
     Given a witness siglum, returns the base siglum of the witness, stripped of all subwitness suffixes.
     """
     def get_base_wit(self, wit):
+        if wit in self.base_wits_by_siglum:
+            return self.base_wits_by_siglum[wit]
         base_wit = wit
         # Strip any et videtur and defective suffixes and any user-specified subwitness suffixes:
-        while (True):
-            suffix_found = False
-            for suffix in self.subwitness_suffixes:
-                if base_wit.endswith(suffix):
-                    suffix_found = True
-                    base_wit = base_wit[:-len(suffix)]
-            if suffix_found:
-                continue
-            if self.fehler_pattern.search(base_wit):
-                suffix_found = True
-                fehler_suffix = self.fehler_pattern.search(base_wit).group()
-                base_wit = base_wit[:-len(fehler_suffix)]
-                continue
-            if base_wit.endswith("V"):
-                suffix_found = True
-                base_wit = base_wit[:-1]
-                continue
-            if not suffix_found:
-                break
+        if self.subwitness_suffix_pattern is not None:
+            base_wit = self.subwitness_suffix_pattern.sub("", base_wit)
+        self.base_wits_by_siglum[wit] = base_wit
         return base_wit
 
+    """
+    Given a dictionary of reading coefficients and a string of witness sigla supporting the reading, 
+    appends the raw coefficient(s) for each base witness (or any of its subwitnesses) as (row, column, value) entries to the collation matrix entry lists.
+    """
+    def add_coefficients(self, rdg_coefficients, wit_str):
+        # Preprocess the witnesses string:
+        processed_witnesses_str = wit_str
+        processed_witnesses_str = self.remove_brackets(processed_witnesses_str)
+        processed_witnesses_str = self.expand_parenthetical_suffixes(processed_witnesses_str)
+        processed_witnesses_str = self.remove_ms_mss_suffixes(processed_witnesses_str)
+        for wit in processed_witnesses_str.split():
+            # Is this a manuscript witness?
+            if self.manuscript_witness_pattern.match(wit):
+                # Extract the base siglum for this witness:
+                base_wit = self.get_base_wit(wit)
+                # Get the column index for this witness, assigning it the next column if it has not yet appeared:
+                j = self.cols_by_witness.setdefault(base_wit, len(self.cols_by_witness))
+                # Then add an entry for each coefficient for this reading in this witness's column
+                # (entries for the same reading and base witness, such as those from multiple subwitnesses, are summed when the matrix is assembled):
+                for label in rdg_coefficients:
+                    self.row_inds.append(self.rows_by_reading[label])
+                    self.col_inds.append(j)
+                    self.coefficients.append(rdg_coefficients[label])
+            # TODO: Fathers and versions are tricky to parse unambiguously; it would be ideal to retrieve and parse them separately?
+            # For now, we'll just stop after we've processed the manuscript witnesses...
+            else:
+                break
+        return
+
     """
     Given an XML <segment/> element, parses the support for its readings, accounting for subwitness prefixes and reading types.
-    The output is a dictionary mapping each base witness to a dictionary of its raw coefficient(s) for the reading(s) it (or any of its subwitnesses) supports.
+    The raw coefficient(s) for the reading(s) each base witness (or any of its subwitnesses) supports are appended as (row, column, value) entries to the collation matrix entry lists.
     """
     def parse_segment(self, xml):
-        readings_by_witness = {} # the output dictionary
         readings_by_number = {} # dictionary mapping reading numbers to their full labels
+        ambiguous_readings = [] # list of (reading text, coefficients dictionary) pairs for ambiguous readings, whose coefficients are filled in once all substantive readings have been seen
+        rdg_supports = [] # list of (coefficients dictionary, witness string, ambiguous flag) triples for the readings in document order
         # Get the full location string for the variation unit:
         segment_id = xml.get("verse") + "/" + xml.get("wordsegs")
         if self.verbose:
             print("Parsing variation unit %s..." % segment_id)
         t0 = time.time()
-        # In a first loop, populate the readings_by_number dictionary for substantive readings, and add reading labels to the readings list:
-        for rdg in xml.xpath(".//segmentReading"):
-            # Determine the type of this reading from its label:
-            rdg_type = ""
-            rdg_label = rdg.get("label").replace("♦", "").strip() # remove diamonds and surrounding whitespace
-            if rdg_label == self.lacunose_rdg_label:
-                rdg_type = "lac"
-            if rdg_label == self.ambiguous_rdg_label:
-                rdg_type = "ambiguous"
-            if rdg_label == self.overlap_rdg_label:
-                rdg_type = "overlap"
-            if self.orthographic_rdg_pattern.match(rdg_label):
-                rdg_type = "orthographic"
-            if self.defective_rdg_pattern.match(rdg_label):
-                rdg_type = "defective"
-            # If this reading is of an ignored or trivial type, then skip it:
-            if rdg_type in self.ignored_reading_types or rdg_type in self.trivial_reading_types:
-                continue
-            rdg_text = rdg.get("reading")
-            rdg_id = " ".join([segment_id, rdg_label, rdg_text])
-            # Ambiguous readings should not be added to the readings list, 
-            # and their coefficients dictionaries will likely split the unit of support between multiple possible substantive readings:
-            if rdg_type != "ambiguous":
-                readings_by_number[rdg_label] = rdg_id
-                self.readings.append(rdg_id)
-        # In a second pass, update the reading coefficients dictionary for each substantive readings and add its value(s) to the reading support dictionaries of all supporting witnesses:
+        # In a single pass, assign each substantive reading a row and record the coefficients and witnesses of every reading;
+        # since ambiguous readings may refer to substantive readings that follow them, their coefficients are only resolved after the pass:
         rdg_coefficients = {}
-        for rdg in xml.xpath(".//segmentReading"):
+        for rdg in xml.iter("segmentReading"):
             # Determine the type of this reading from its label:
             rdg_type = ""
             rdg_label = rdg.get("label").replace("♦", "").strip() # remove diamonds and surrounding whitespace
-            if rdg_label == self.lacunose_rdg_label:
-                rdg_type = "lac"
-            if rdg_label == self.ambiguous_rdg_label:
-                rdg_type = "ambiguous"
-            if rdg_label == self.overlap_rdg_label:
-                rdg_type = "overlap"
-            if self.orthographic_rdg_pattern.match(rdg_label):
-                rdg_type = "orthographic"
-            if self.defective_rdg_pattern.match(rdg_label):
-                rdg_type = "defective"
+            rdg_type_match = self.rdg_type_pattern.match(rdg_label)
+            if rdg_type_match is not None:
+                rdg_type = rdg_type_match.lastgroup
             # If this reading is of an ignored type, then skip it:
             if rdg_type in self.ignored_reading_types:
                 continue
-            # If this reading is not of a trivial type, then update the coefficients dictionary:
+            is_ambiguous = False
+            # If this reading is not of a trivial type, then update the coefficients dictionary
+            # (trivial readings share the coefficients dictionary of the last non-trivial reading):
             if rdg_type not in self.trivial_reading_types:
-                rdg_label = rdg.get("label").replace("♦", "").strip() # remove diamonds and surrounding whitespace
                 rdg_text = rdg.get("reading")
-                rdg_id = " ".join([segment_id, rdg_label, rdg_text])
-                rdg_coefficients = {}
                 # Ambiguous readings should not be added to the readings list, 
                 # and their coefficients dictionaries will likely split the unit of support between multiple possible substantive readings:
                 if rdg_type == "ambiguous":
-                    # Following the ECM convention, possible readings are separated by forward slashes:
-                    possible_reading_labels = rdg_text.replace("_f", "").split("/") # remove the defective suffix
-                    # Determine how many of these correspond to substantive readings:
-                    for possible_reading_label in possible_reading_labels:
-                        if possible_reading_label in readings_by_number:
-                            rdg_coefficients[readings_by_number[possible_reading_label]] = 1
-                    # If the ambiguous reading corresponds to no substantive reading, then ignore it;
-                    # otherwise, normalize the coefficients to sum to 1:
-                    if len(rdg_coefficients) == 0:
-                        continue
-                    else:
-                        for rdg_coefficients_id in rdg_coefficients:
-                            rdg_coefficients[rdg_coefficients_id] = 1 / len(rdg_coefficients)
+                    is_ambiguous = True
+                    rdg_coefficients = {}
+                    ambiguous_readings.append((rdg_text, rdg_coefficients))
                 else:
-                    rdg_coefficients[rdg_id] = 1
-            # Now preprocess the witnesses string and add the coefficients for this reading to the support dictionary of every witness supporting this reading:
-            if rdg.get("witnesses") is None:
+                    rdg_id = " ".join([segment_id, rdg_label, rdg_text])
+                    readings_by_number[rdg_label] = rdg_id
+                    self.rows_by_reading.setdefault(rdg_id, len(self.rows_by_reading))
+                    rdg_coefficients = {rdg_id: 1}
+            wit_str = rdg.get("witnesses")
+            if wit_str is None:
                 continue
-            processed_witnesses_str = rdg.get("witnesses")
-            processed_witnesses_str = self.remove_square_brackets(processed_witnesses_str)
-            processed_witnesses_str = self.remove_angle_brackets(processed_witnesses_str)
-            processed_witnesses_str = self.expand_parenthetical_suffixes(processed_witnesses_str)
-            processed_witnesses_str = self.remove_ms_mss_suffixes(processed_witnesses_str)
-            for wit in processed_witnesses_str.split():
-                # Is this a manuscript witness?
-                if self.manuscript_witness_pattern.match(wit):
-                    # Extract the base siglum for this witness:
-                    base_wit = self.get_base_wit(wit)
-                    # If the readings_by_witness dictionary doesn't have an entry for this witness yet, then create one:
-                    if base_wit not in readings_by_witness:
-                        readings_by_witness[base_wit] = {}
-                    # Then add the coefficient(s) for this reading to this witness's dictionary:
-                    base_wit_coefficients = readings_by_witness[base_wit]
-                    for label in rdg_coefficients:
-                        if label not in base_wit_coefficients:
-                            base_wit_coefficients[label] = 0
-                        base_wit_coefficients[label] += rdg_coefficients[label]
-                    readings_by_witness[base_wit] = base_wit_coefficients
-                # TODO: Fathers and versions are tricky to parse unambiguously; it would be ideal to retrieve and parse them separately?
-                # For now, we'll just stop after we've processed the manuscript witnesses...
-                else:
-                    break
+            rdg_supports.append((rdg_coefficients, wit_str, is_ambiguous))
+        # Then fill in the coefficients of the ambiguous readings:
+        for rdg_text, rdg_coefficients in ambiguous_readings:
+            # Following the ECM convention, possible readings are separated by forward slashes:
+            possible_reading_labels = rdg_text.replace("_f", "").split("/") # remove the defective suffix
+            # Determine how many of these correspond to substantive readings:
+            for possible_reading_label in possible_reading_labels:
+                if possible_reading_label in readings_by_number:
+                    rdg_coefficients[readings_by_number[possible_reading_label]] = 1
+            # Normalize the coefficients to sum to 1:
+            for rdg_coefficients_id in rdg_coefficients:
+                rdg_coefficients[rdg_coefficients_id] = 1 / len(rdg_coefficients)
+        # Now add the coefficients for each reading to the collation matrix entries of every witness supporting it, in document order;
+        # an ambiguous reading that corresponds to no substantive reading is ignored, but the witnesses of any trivial readings under it are still counted:
+        for rdg_coefficients, wit_str, is_ambiguous in rdg_supports:
+            if is_ambiguous and len(rdg_coefficients) == 0:
+                continue
+            self.add_coefficients(rdg_coefficients, wit_str)
         t1 = time.time()
         if self.verbose:
             print("Done in %0.4fs." % (t1 - t0))
-        return readings_by_witness
+        return
+
+    """
+    Given a file-like HTTP response containing VMR apparatus XML, streams its <segment/> elements in document order,
+    freeing each one (and anything before it) once it has been processed, so that the full tree is never held in memory.
+    """
+    def iterparse_segments(self, response):
+        # Only attributes are read from the VMR XML, so whitespace-only text can be dropped along with the ID table and entity resolution:
+        for event, segment in et.iterparse(response, events=("end",), tag="segment", remove_blank_text=True, collect_ids=False, huge_tree=True, resolve_entities=False):
+            yield segment
+            segment.clear()
+            while segment.getprevious() is not None:
+                del segment.getparent()[0]
+
+    """
+    Given a VMR API request URL, returns a context manager for a file-like object containing the (decompressed) response, caching the response (gzip-compressed) on disk along with its ETag.
+    A cached response is reused if the server reports that it has not been modified since it was cached,
+    if it has no ETag and is younger than the maximum cache age, or if the server cannot be reached or returns an error.
+    """
+    @contextlib.contextmanager
+    def open_cached_response(self, request_str):
+        # Ask for the response to be gzip-compressed, since verbose apparatus XML compresses very well:
+        request = urllib.request.Request(request_str, headers={"Accept-Encoding": "gzip"})
+        if self.cache_dir is None:
+            # (closing a GzipFile does not close the file object it wraps, so close the response separately)
+            with urllib.request.urlopen(request) as r:
+                if r.headers.get("Content-Encoding") == "gzip":
+                    with gzip.GzipFile(fileobj=r) as f:
+                        yield f
+                else:
+                    yield r
+            return
+        cache_path = os.path.join(self.cache_dir, hashlib.sha1(request_str.encode("utf-8")).hexdigest() + ".xml.gz")
+        etag_path = cache_path + ".etag"
+        etag = None
+        if os.path.exists(cache_path):
+            if os.path.exists(etag_path):
+                with open(etag_path, "r", encoding="utf-8") as f:
+                    etag = f.read()
+            elif time.time() - os.path.getmtime(cache_path) < self.cache_max_age:
+                with gzip.open(cache_path, "rb") as f:
+                    yield f
+                return
+        if etag is not None:
+            request.add_header("If-None-Match", etag)
+        try:
+            with urllib.request.urlopen(request) as r:
+                # Write the response to a uniquely named temporary file first, so that an interrupted download never leaves a truncated response in the cache
+                # and concurrent runs do not overwrite each other's downloads
+                # (a response that the server has already gzip-compressed can be stored as it is; any other response is compressed for storage):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as tmp:
+                    try:
+                        if r.headers.get("Content-Encoding") == "gzip":
+                            shutil.copyfileobj(r, tmp)
+                        else:
+                            with gzip.GzipFile(fileobj=tmp, mode="wb") as f:
+                                shutil.copyfileobj(r, f)
+                    except BaseException:
+                        tmp.close()
+                        os.remove(tmp.name)
+                        raise
+                os.replace(tmp.name, cache_path)
+                etag = r.headers.get("ETag")
+                if etag is not None:
+                    with open(etag_path, "w", encoding="utf-8") as f:
+                        f.write(etag)
+                elif os.path.exists(etag_path):
+                    os.remove(etag_path)
+        except urllib.error.HTTPError as e:
+            # A 304 (Not Modified) response means that the cached response is still current;
+            # after any other error response (e.g., if the server is temporarily unavailable), fall back on the cached response if there is one:
+            if e.code != 304:
+                if not os.path.exists(cache_path):
+                    raise
+                if self.verbose:
+                    print("The VMR returned an error (%s); using the cached response instead." % e)
+        except urllib.error.URLError:
+            if not os.path.exists(cache_path):
+                raise
+            if self.verbose:
+                print("Could not reach the VMR; using the cached response instead.")
+        with gzip.open(cache_path, "rb") as f:
+            yield f
 
     """
     Given a content tag (e.g., "Acts.1.1-5" for Acts 1:1-5, "Acts.5" for Acts 5, or "Acts" for all of Acts) to an .xml file containing a TEI collation, read its contents into a collation matrix and apply the appropriate postprocessing.
@@ -537,57 +719,23 @@ class vmr_collation_parser(collation_parser):
         t0 = time.time()
         # Get the appropriate project name based on the book in question:
         request_str = "https://ntvmr.uni-muenster.de/community/vmr/api/variant/apparatus/get/?indexContent=%s&positiveConversion=true&buildA=false&format=xml" % index
-        # Parse the contents of the HTTP request as an XML string:
-        xml = None
-        with urllib.request.urlopen(request_str) as r:
-            contents = r.read()
-            xml = et.fromstring(contents)
-        t1 = time.time()
-        if self.verbose:
-            print("Done in %0.4fs." % (t1 - t0))
-        # Reinitialize the reading and witness lists:
-        self.readings = []
-        self.witnesses = []
-        # Populate them and a dictionary mapping witnesses to a dictionary of their reading coefficients, parsing one variation unit at a time:
-        if self.verbose:
-            print("Parsing variation units in XML response...")
-        t0 = time.time()
-        readings_by_witness = {}
+        with self.open_cached_response(request_str) as r:
+            t1 = time.time()
+            if self.verbose:
+                print("Done in %0.4fs." % (t1 - t0))
+            # Populate the reading and witness index dictionaries and the lists of collation matrix entries, streaming and parsing one variation unit at a time:
+            if self.verbose:
+                print("Parsing variation units in XML response...")
+            t0 = time.time()
+            n_segments = self.parse_units(self.iterparse_segments(r), "parse_segment")
         # Set the minimum extant readings threshold based on the number of variation units in the input:
-        self.min_extant = int(self.min_extant_proportion * len(xml.xpath("//segment")))
-        for segment in xml.xpath("//segment"):
-            readings_by_witness_for_segment = self.parse_segment(segment)
-            # Proceed for every (base) witness accounted for in this unit:
-            for wit in readings_by_witness_for_segment:
-                # If this witness has not yet appeared, then add it to the list and initialize its reading coefficient dictionary:
-                if wit not in readings_by_witness:
-                    self.witnesses.append(wit)
-                    readings_by_witness[wit] = {}
-                # Then add its coefficients for this unit to its reading coefficient dictionary:
-                wit_coefficients = readings_by_witness[wit]
-                wit_coefficients_for_segment = readings_by_witness_for_segment[wit]
-                for label in wit_coefficients_for_segment:
-                    wit_coefficients[label] = wit_coefficients_for_segment[label]
-                readings_by_witness[wit] = wit_coefficients
+        self.set_min_extant(n_segments)
         # TODO: If we can retrieve fathers and versions separately, we would request and process their variation units in separate loops next.
-        # Now populate the collation matrix, using dictionaries to map values to row and column indices:
-        rows_by_reading = {} # a dictionary mapping variant reading labels to their corresponding row indices
-        cols_by_witness = {} # a dictionary mapping base witness sigla to their corresponding column indices
-        for i, rdg in enumerate(self.readings):
-            rows_by_reading[rdg] = i
-        for j, wit in enumerate(self.witnesses):
-            cols_by_witness[wit] = j
-        self.collation_matrix = np.zeros(shape=(len(self.readings), len(self.witnesses)))
-        for wit in readings_by_witness:
-            j = cols_by_witness[wit]
-            wit_coefficients = readings_by_witness[wit]
-            for rdg in wit_coefficients:
-                i = rows_by_reading[rdg]
-                coefficient = wit_coefficients[rdg]
-                self.collation_matrix[i,j] = coefficient
+        # Now assemble the collation matrix from its entries:
+        self.assemble_collation_matrix()
         t1 = time.time()
         if self.verbose:
-            print("Total time to parse all %d variation units: %0.4fs." % (len(xml.xpath("//segment")), t1 - t0))
+            print("Total time to parse all %d variation units: %0.4fs." % (n_segments, t1 - t0))
         if self.verbose:
             print("Size of raw collation matrix: %d rows (readings), %d columns (witnesses)." % self.collation_matrix.shape)
         # Finally, postprocess this matrix:
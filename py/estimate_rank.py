@@ -1,9 +1,7 @@
 #!/usr/bin/env python3
 
 import time # to time calculations for users
-import pandas as pd # for writing output to Excel
-from collation_parser import collation_parser, tei_collation_parser, vmr_collation_parser
-from collation_factorizer import collation_factorizer
+import math # for detecting undefined metrics
 import argparse # for parsing command-line input
 
 """
@@ -41,6 +39,9 @@ def main():
     input_addr = args.input
     min_rank = args.minrank
     max_rank = args.maxrank
+    # Only now that the arguments are valid, import the parsing and factorization modules (which take some time to load their numerical dependencies):
+    from collation_parser import tei_collation_parser, vmr_collation_parser
+    from collation_factorizer import collation_factorizer
     # Initialize the collation_parser instance and use it to read in the collation input:
     cp = None # the collation_parser instance; depending on the type of input, it will either be a tei_collation_parser or a vmr_collation_parser
     if input_addr.endswith(".xml"):
@@ -67,21 +68,32 @@ def main():
     else:
         if output_addr.endswith(".xlsx"):
             if verbose:
-                print("Writing final collation matrix to Excel...")
+                print("Writing rank estimation metrics to Excel...")
             t0 = time.time()
-            rank_metrics_df = pd.DataFrame(data=rank_metrics)
-            #Then write the Excel collation table to output:
-            rank_metrics_df.to_excel(output_addr, sheet_name="Rank Estimation", index=False)
+            import xlsxwriter # for writing output to Excel; imported here, as it is only needed for this output format
+            # Write the rank estimation metrics as a table with one row per rank:
+            workbook = xlsxwriter.Workbook(output_addr, {"constant_memory": True})
+            header_format = workbook.add_format({"bold": True})
+            worksheet = workbook.add_worksheet("Rank Estimation")
+            # Use a fixed header, so that an empty range of ranks still yields a sheet with a header row:
+            metric_names = ["rank", "cophenetic", "rss", "evar", "basis_sparseness", "mixture_sparseness"]
+            worksheet.write_row(0, 0, metric_names, header_format)
+            for i, rank_metrics_dict in enumerate(rank_metrics):
+                row = [rank_metrics_dict[metric_name] for metric_name in metric_names]
+                # Leave undefined metrics (e.g., the cophenetic correlation at rank 1) blank, as xlsxwriter cannot write NaN or infinite numbers:
+                worksheet.write_row(i + 1, 0, [None if isinstance(value, float) and not math.isfinite(value) else value for value in row])
+            workbook.close()
             t1 = time.time()
             if verbose:
                 print("Done in %0.4fs." % (t1 - t0))
         elif output_addr.endswith(".json"):
             if verbose:
-                print("Writing final collation matrix to JSON...")
+                print("Writing rank estimation metrics to JSON...")
             t0 = time.time()
-            rank_metrics_df = pd.DataFrame(data=rank_metrics)
-            #Then write the Excel collation table to output:
-            rank_metrics_df.to_json(output_addr, orient="records")
+            import orjson # for writing output to JSON; imported here, as it is only needed for this output format
+            # Write the rank estimation metrics as a list of records, one per rank:
+            with open(output_addr, "wb") as f:
+                f.write(orjson.dumps(rank_metrics, option=orjson.OPT_SERIALIZE_NUMPY))
             t1 = time.time()
             if verbose:
                 print("Done in %0.4fs." % (t1 - t0))
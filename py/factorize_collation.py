@@ -1,9 +1,6 @@
 #!/usr/bin/env python3
 
 import time # to time calculations for users
-import pandas as pd # for writing output to Excel
-from collation_parser import collation_parser, tei_collation_parser, vmr_collation_parser
-from collation_factorizer import collation_factorizer
 import argparse
 
 """
@@ -37,6 +34,9 @@ def main():
     input_addr = args.input
     output_addr = args.output
     rank = args.rank
+    # Only now that the arguments are valid, import the parsing and factorization modules (which take some time to load their numerical dependencies):
+    from collation_parser import tei_collation_parser, vmr_collation_parser
+    from collation_factorizer import collation_factorizer
     # Initialize the collation_parser instance and use it to read in the collation input:
     cp = None # the collation_parser instance; depending on the type of input, it will either be a tei_collation_parser or a vmr_collation_parser
     if input_addr.endswith(".xml"):
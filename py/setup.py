@@ -9,17 +9,19 @@ setup(
     license='MIT',
     author_email='jjmccollum@vt.edu',
     url='https://github.com/jjmccollum/collation-nmf',
-    python_requires='>=3.5',
+    python_requires='>=3.9',
     install_requires=[
-        'pandas',
-        'sklearn',
-        'scipy',
-        'nimfa'
+        'numpy>=1.23',
+        'scipy>=1.10',
+        'scikit-learn>=1.3',
+        'lxml>=4.9',
+        'xlsxwriter',
+        'orjson'
     ],
 	classifiers=[
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ]
 )
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+
+import os # for locating the modules under test and the example data
+import sys # for making the modules under test importable
+import pytest
+
+"""
+The modules under test are run as scripts from the py directory, so make them importable the same way.
+"""
+py_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, py_dir)
+
+"""
+Returns the path to the example TEI XML collation shipped with the repository.
+"""
+@pytest.fixture
+def example_collation_addr():
+    return os.path.join(os.path.dirname(py_dir), "example", "3_john_collation.xml")
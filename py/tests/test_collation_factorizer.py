@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import zipfile # for checking that Excel output was written completely
+import numpy as np
+from collation_parser import tei_collation_parser
+from collation_factorizer import collation_factorizer
+
+"""
+Returns a parser that has read the given collation with the settings used in the README examples.
+"""
+def read_example_collation(example_collation_addr):
+    cp = tei_collation_parser(0.95, True, "zw-", ["*", "T"], ["defective"], ["lac"])
+    cp.read(example_collation_addr)
+    return cp
+
+"""
+At rank 1, the mixture sparseness is undefined, but the Excel output should still be written.
+"""
+def test_to_excel_at_rank_1(tmp_path, example_collation_addr):
+    cf = collation_factorizer(read_example_collation(example_collation_addr))
+    cf.factorize_collation(1)
+    assert np.isnan(cf.fit_summary["mixture_sparseness"])
+    output_addr = str(tmp_path / "rank_1.xlsx")
+    cf.to_excel(output_addr)
+    assert zipfile.is_zipfile(output_addr)
+
+"""
+Rank estimation trials with different seeds should start from different initializations (and so not reproduce each other's factorizations exactly),
+so that the consensus across trials (and the cophenetic correlation computed from it) reflects how stable the groupings really are.
+"""
+def test_rank_estimation_trials_differ(example_collation_addr):
+    from collation_factorizer import get_random_vcol_seed, run_rank_estimation_trial
+    collation_matrix = read_example_collation(example_collation_addr).collation_matrix
+    seeds = np.random.SeedSequence(0).spawn(2)
+    W_0, H_0 = get_random_vcol_seed(collation_matrix, 3, np.random.default_rng(seeds[0]))
+    W_1, H_1 = get_random_vcol_seed(collation_matrix, 3, np.random.default_rng(seeds[1]))
+    assert not np.allclose(W_0, W_1)
+    assert not np.allclose(H_0, H_1)
+    trial_0_rss = [metrics[0] for witness_groups, metrics in run_rank_estimation_trial(collation_matrix, range(2, 5), seeds[0])]
+    trial_1_rss = [metrics[0] for witness_groups, metrics in run_rank_estimation_trial(collation_matrix, range(2, 5), seeds[1])]
+    assert trial_0_rss != trial_1_rss
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os # for simulating multiple CPUs
+import io # for serving VMR apparatus XML from memory
+import numpy as np
+from collation_parser import tei_collation_parser, vmr_collation_parser
+
+"""
+TEI XML collation in which ambiguous readings precede the substantive readings they refer to,
+and in which witness 09 is cited only for a trivial reading following an ambiguous reading that cannot be resolved.
+"""
+tei_collation = b"""<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>
+<app n="u1">
+  <rdg n="W1/2" type="ambiguous" wit="05 06"/>
+  <rdg n="1" wit="01 02*"><w>alpha</w> <w>beta</w></rdg>
+  <rdg n="1f" type="defective" wit="07"><w>alfa</w></rdg>
+  <rdg n="2" wit="03 02T"><w>gamma</w></rdg>
+  <rdg n="W4/5" type="ambiguous" wit="08"/>
+  <rdg n="4f" type="defective" wit="09 01"><w>x</w></rdg>
+  <rdg n="lac" type="lac" wit="10"/>
+</app>
+<app n="u2">
+  <rdg n="1" wit="10 04"><w>delta</w></rdg>
+  <rdg n="W1/2" type="ambiguous" wit="11"/>
+  <rdg n="2" wit="01 03 05 06 07 08 09"><w>eps</w></rdg>
+</app>
+</p></body></text></TEI>
+"""
+
+"""
+The same collation in the form of a VMR apparatus, in which witness 02/2 is cited only for a trivial reading following an ambiguous reading that cannot be resolved.
+"""
+vmr_apparatus = b"""<?xml version="1.0" encoding="UTF-8"?>
+<apparatus>
+<segment verse="Acts.1.1" wordsegs="2-4">
+  <segmentReading label="zw" reading="a/b" witnesses="05 06"/>
+  <segmentReading label="a" reading="alpha beta" witnesses="01 02*"/>
+  <segmentReading label="af" reading="alfa" witnesses="07"/>
+  <segmentReading label="b" reading="gamma" witnesses="03 02C"/>
+  <segmentReading label="zw" reading="d/e" witnesses="08"/>
+  <segmentReading label="df" reading="x" witnesses="02/2 01"/>
+  <segmentReading label="zz" reading="" witnesses="10"/>
+</segment>
+<segment verse="Acts.1.1" wordsegs="6">
+  <segmentReading label="a" reading="delta" witnesses="10 04"/>
+  <segmentReading label="zw" reading="a/b" witnesses="11"/>
+  <segmentReading label="b" reading="eps" witnesses="01 03 05 06 07 08 09"/>
+</segment>
+</apparatus>
+"""
+
+"""
+Witness columns should appear in the order in which the witnesses are first cited (as the readings were parsed before parsing was done in a single pass),
+including witnesses cited only for trivial readings under an ambiguous reading that cannot be resolved.
+"""
+def test_tei_witness_order(tmp_path):
+    input_addr = str(tmp_path / "collation.xml")
+    with open(input_addr, "wb") as f:
+        f.write(tei_collation)
+    cp = tei_collation_parser(0.0, False, "W", ["*", "T"], ["defective"], ["lac"])
+    cp.read(input_addr)
+    assert cp.witnesses == ["05", "06", "01", "02", "07", "03", "09", "10", "04", "11", "08"]
+    assert cp.readings == ["u1 1 alpha  beta", "u1 2 gamma", "u2 1 delta", "u2 2 eps"]
+    expected_matrix = np.array([
+        [0.5, 0.5, 1, 1, 1, 0, 0, 0, 0, 0, 0],
+        [0.5, 0.5, 0, 1, 0, 1, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 1, 1, 0.5, 0],
+        [1, 1, 1, 0, 1, 1, 1, 0, 0, 0.5, 1],
+    ])
+    assert np.allclose(cp.collation_matrix.toarray(), expected_matrix)
+
+"""
+The same holds for VMR apparatus input.
+"""
+def test_vmr_witness_order():
+    cp = vmr_collation_parser(0.0, False, "", ["*", "C"], ["defective"], ["lac"])
+    cp.open_cached_response = lambda request_str: io.BytesIO(vmr_apparatus)
+    cp.read("Acts.1.1")
+    assert cp.witnesses == ["05", "06", "01", "02", "07", "03", "02/2", "10", "04", "11", "08", "09"]
+    assert cp.readings == ["Acts.1.1/2-4 a alpha beta", "Acts.1.1/2-4 b gamma", "Acts.1.1/6 a delta", "Acts.1.1/6 b eps"]
+
+"""
+TEI XML collation with a variation unit nested in a reading of another unit.
+"""
+nested_tei_collation = b"""<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>
+<app n="u1">
+  <rdg n="1" wit="01 02"><w>a</w> <app n="u1a"><rdg n="1" wit="01"><w>b</w></rdg><rdg n="2" wit="02 03"><w>c</w></rdg></app></rdg>
+  <rdg n="2" wit="03 04"><w>d</w></rdg>
+</app>
+<app n="u2"><rdg n="1" wit="05 01"><w>e</w></rdg><rdg n="2" wit="02 03 04"><w>f</w></rdg></app>
+</p></body></text></TEI>
+"""
+
+"""
+Nested variation units should be parsed in document order, after the units that contain them,
+whether the units are parsed serially or in worker processes.
+"""
+def test_tei_nested_app_order(tmp_path, monkeypatch):
+    # Report more than one CPU, so that the units past min_parallel_units are parsed in worker processes even on a single-CPU machine:
+    monkeypatch.setattr(os, "cpu_count", lambda: 2)
+    input_addr = str(tmp_path / "collation.xml")
+    with open(input_addr, "wb") as f:
+        f.write(nested_tei_collation)
+    for min_parallel_units in [1000, 0]:
+        cp = tei_collation_parser(0.0, False, "", [], [], [])
+        cp.min_parallel_units = min_parallel_units
+        cp.read(input_addr)
+        assert cp.readings == ["u1 1 a  ", "u1 2 d", "u1a 1 b", "u1a 2 c", "u2 1 e", "u2 2 f"]
+        assert cp.witnesses == ["01", "02", "03", "04", "05"]